@@ -4,20 +4,21 @@ from __future__ import annotations
 import os
 from pathlib import Path
 from typing import Dict, List
+import json
 import uuid
-import threading
 import traceback
 import logging
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
 from multi_doc_chat.src.document_ingestion.data_ingestion import ingest_upload_files
-from multi_doc_chat.rag_service import create_rag_service
+from multi_doc_chat.rag_service import get_rag_service
 from sentence_transformers import SentenceTransformer
 
 # --- Configure logging ---
@@ -40,7 +41,7 @@ FAISS_DIR = ROOT_DIR / "faiss_index"
 MODELS_DIR = ROOT_DIR / "models"
 
 # --- Create RAGService ---
-rag_service = create_rag_service(faiss_dir=str(FAISS_DIR))
+rag_service = get_rag_service(str(FAISS_DIR))
 
 # After creating rag_service
 if rag_service.loader.embedder is None:
@@ -55,7 +56,7 @@ else:
     logger.warning("Embedding model not loaded")
 
 # --- FastAPI app ---
-app = FastAPI(title="RAG Solution", version="0.1.0")
+app = FastAPI(title="RAG Solution", version="0.1.0", default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -69,8 +70,9 @@ templates_dir = ROOT_DIR / "templates"
 if static_dir.exists():
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 templates = Jinja2Templates(directory=str(templates_dir))
+# index.html has no per-request variables, so render it once at startup
+INDEX_HTML = templates.get_template("index.html").render()
 
-STATE_LOCK = threading.Lock()
 SESSIONS: Dict[str, List[dict]] = {}
 
 # --- Pydantic models ---
@@ -86,6 +88,11 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
 
+# --- Persist the FAISS index on shutdown (it is checkpointed, not saved per upload) ---
+@app.on_event("shutdown")
+def persist_index():
+    rag_service.checkpoint()
+
 # --- Health endpoint ---
 @app.get("/health")
 def health():
@@ -97,8 +104,8 @@ def health():
 
 # --- Home endpoint ---
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+def home():
+    return HTMLResponse(INDEX_HTML, headers={"Cache-Control": "public, max-age=300"})
 
 # --- Upload endpoint ---
 @app.post("/upload", response_model=UploadResponse)
@@ -112,8 +119,7 @@ async def upload(files: List[UploadFile] = File(...)) -> UploadResponse:
     try:
         logger.info("Files received: %s", [f.filename for f in files])
 
-        with STATE_LOCK:
-            await ingest_upload_files(files, rag_service)
+        await ingest_upload_files(files, rag_service)
 
         logger.info("Files ingested successfully for session %s", session_id)
         return UploadResponse(
@@ -128,19 +134,22 @@ async def upload(files: List[UploadFile] = File(...)) -> UploadResponse:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
 # --- Chat endpoint ---
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest) -> ChatResponse:
+def _validate_chat(req: ChatRequest) -> tuple[str, str]:
     session_id = req.session_id or ""
     if not session_id or session_id not in SESSIONS:
         raise HTTPException(status_code=400, detail="Invalid or expired session_id. Re-upload documents.")
     message = (req.message or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
+    return session_id, message
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest) -> ChatResponse:
+    session_id, message = _validate_chat(req)
 
     try:
         logger.info("Chat request received: session=%s, message=%s", session_id, message)
-        with STATE_LOCK:
-            answer = rag_service.query(message)
+        answer = await run_in_threadpool(rag_service.query, message)
         SESSIONS[session_id].append({"role": "user", "content": message})
         SESSIONS[session_id].append({"role": "assistant", "content": answer})
         logger.info("Chat response sent for session %s", session_id)
@@ -151,6 +160,30 @@ async def chat(req: ChatRequest) -> ChatResponse:
         logger.error("Chat failed: %s\n%s", e, tb)
         raise HTTPException(status_code=500, detail=f"Chat failed: {e}")
 
+# --- Streaming chat endpoint (Server-Sent Events) ---
+@app.post("/chat_stream")
+async def chat_stream(req: ChatRequest) -> StreamingResponse:
+    session_id, message = _validate_chat(req)
+    logger.info("Chat stream request received: session=%s, message=%s", session_id, message)
+
+    def events():
+        parts: List[str] = []
+        try:
+            for piece in rag_service.query_stream(message):
+                parts.append(piece)
+                yield f"data: {json.dumps(piece)}\n\n"
+        except Exception as e:
+            logger.error("Chat stream failed: %s\n%s", e, traceback.format_exc())
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+            return
+        answer = "".join(parts).strip()
+        SESSIONS[session_id].append({"role": "user", "content": message})
+        SESSIONS[session_id].append({"role": "assistant", "content": answer})
+        logger.info("Chat stream completed for session %s", session_id)
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- List sessions ---
 @app.get("/sessions")
 def list_sessions():
@@ -161,4 +194,18 @@ if __name__ == "__main__":
     import uvicorn
     port_raw = os.getenv("PORT", "7860")
     port = int(port_raw) if port_raw.strip() else 7860
-    uvicorn.run("app:app", host="0.0.0.0", port=port)
+    # single worker: SESSIONS and the loaded models live in this process
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=port,
+        # "auto" picks uvloop/httptools when installed (not on Windows) and
+        # falls back to asyncio/h11; the C versions beat those for many small
+        # JSON responses
+        loop="auto",
+        http="auto",
+        # bound queueing under bursts: excess connections get a fast 503
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "64")),
+        backlog=int(os.getenv("BACKLOG", "128")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "15")),
+    )
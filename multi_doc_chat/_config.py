@@ -0,0 +1,22 @@
+"""
+multi_doc_chat/_config.py
+configs/default.yaml, parsed once per process.
+"""
+
+from functools import cache
+from pathlib import Path
+import yaml
+
+CFG_PATH = Path(__file__).resolve().parent.parent / "configs" / "default.yaml"
+
+# libyaml's C parser when PyYAML was built with it
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@cache
+def get_config() -> dict:
+    """Settings from configs/default.yaml, or {} when the file is absent."""
+    if not CFG_PATH.exists():
+        return {}
+    with open(CFG_PATH, "r") as f:
+        return yaml.load(f, Loader=_Loader) or {}
@@ -0,0 +1,78 @@
+"""
+multi_doc_chat/dedup.py
+Persistent record of already-indexed chunks, used to skip re-embedding them.
+"""
+
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+import hashlib
+import sqlite3
+import threading
+
+# SQLite's default limit on bound parameters per statement is 999.
+_QUERY_BATCH = 500
+
+
+class SeenChunks:
+    """
+    Set of chunk digests (128-bit blake2b of the UTF-8 text) kept in a small
+    SQLite table. The database is only opened on first use.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY)")
+        return self._conn
+
+    def filter_new(self, texts: List[str]) -> Tuple[List[str], List[bytes]]:
+        """
+        Drop texts that were already recorded or repeat earlier in ``texts``.
+        Returns the remaining texts with their digests, in input order.
+        """
+        digests = [self.digest(t) for t in texts]
+        known = self.known(digests)
+
+        new_texts, new_digests = [], []
+        for text, d in zip(texts, digests):
+            if d in known:
+                continue
+            known.add(d)
+            new_texts.append(text)
+            new_digests.append(d)
+        return new_texts, new_digests
+
+    def known(self, digests: List[bytes]) -> Set[bytes]:
+        """The subset of ``digests`` already recorded."""
+        known: Set[bytes] = set()
+        with self._lock:
+            db = self._db()
+            for i in range(0, len(digests), _QUERY_BATCH):
+                batch = digests[i:i + _QUERY_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(f"SELECT digest FROM seen WHERE digest IN ({marks})", batch)
+                known.update(row[0] for row in rows)
+        return known
+
+    def add(self, digests: Iterable[bytes]):
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR IGNORE INTO seen (digest) VALUES (?)", ((d,) for d in digests))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            if self._conn is None and not self.path.exists():
+                return
+            db = self._db()
+            db.execute("DELETE FROM seen")
+            db.commit()
@@ -0,0 +1,107 @@
+"""
+multi_doc_chat/document_store.py
+Chunk texts stored on disk and memory-mapped, decoded only when accessed.
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+import mmap
+import operator
+import os
+import numpy as np
+
+
+class DocumentStore:
+    """
+    List-like store of chunk texts. Persisted as ``docs.bin`` (concatenated
+    UTF-8, append-only) plus ``docs.idx`` (int64 offsets, n + 1 entries).
+    Loaded rows stay in the OS page cache instead of becoming Python str
+    objects at startup; chunks added since the last ``save()`` are held in
+    memory.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.bin_path = self.directory / "docs.bin"
+        self.idx_path = self.directory / "docs.idx"
+        self._mm: Optional[mmap.mmap] = None
+        self._offsets = np.zeros(1, dtype="int64")
+        self._tail: List[str] = []
+        self._load()
+
+    def _load(self):
+        legacy = self.directory / "docs.txt"
+        if not self.idx_path.exists() and legacy.exists():
+            with open(legacy, "r", encoding="utf-8") as f:
+                self._tail = [line.rstrip("\n") for line in f]
+            self.save()
+            legacy.unlink()
+            return
+        if self.idx_path.exists() and self.bin_path.exists():
+            self._offsets = np.load(self.idx_path, mmap_mode="r")
+            if self._offsets[-1] > 0:
+                with open(self.bin_path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def _stored(self) -> int:
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self._stored + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = operator.index(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        if i >= self._stored:
+            return self._tail[i - self._stored]
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        if start == end:
+            # docs.bin is not mapped when every stored chunk is empty
+            return ""
+        return self._mm[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, text: str):
+        self._tail.append(text)
+
+    def extend(self, texts: Iterable[str]):
+        self._tail.extend(texts)
+
+    def save(self):
+        """
+        Persist the in-memory tail and re-map the files. Only the new chunks
+        are written: their bytes are appended to docs.bin after the last
+        indexed offset, then docs.idx is replaced. Nothing already stored is
+        rewritten, so saving after every ingest costs O(batch) text I/O.
+        """
+        if not self._tail and self.idx_path.exists():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_idx = self.idx_path.with_suffix(".idx.tmp")
+        stored_bytes = int(self._offsets[-1])
+        encoded = [text.encode("utf-8") for text in self._tail]
+        lengths = np.fromiter(map(len, encoded), dtype="int64", count=len(encoded))
+        offsets = np.concatenate([self._offsets, stored_bytes + np.cumsum(lengths)])
+        mode = "r+b" if self.bin_path.exists() else "wb"
+        with open(self.bin_path, mode) as f:
+            # bytes past the indexed end are leftovers of an interrupted save;
+            # the mapped region before it is never touched
+            f.seek(stored_bytes)
+            f.write(b"".join(encoded))
+            f.truncate()
+        with open(tmp_idx, "wb") as f:
+            np.save(f, offsets)
+        os.replace(tmp_idx, self.idx_path)
+        self._mm = None
+        self._offsets = np.zeros(1, dtype="int64")
+        self._tail = []
+        self._load()
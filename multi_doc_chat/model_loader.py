@@ -1,32 +1,68 @@
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional
-import yaml
+from typing import Iterator, List, Optional, Tuple, Union
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import threading
 import numpy as np
 
+from ._config import get_config
+
 try:
     from llama_cpp import Llama
 except Exception:
     Llama = None
 
+try:
+    from llama_cpp import LlamaRAMCache
+except Exception:
+    LlamaRAMCache = None
+
+try:
+    from llama_cpp import llama_supports_gpu_offload
+except Exception:
+    llama_supports_gpu_offload = None
+
 try:
     from sentence_transformers import SentenceTransformer
 except Exception:
     SentenceTransformer = None
 
+try:
+    import torch
+except Exception:
+    torch = None
+
+try:
+    import intel_extension_for_pytorch as ipex
+except Exception:
+    ipex = None
+
+logger = logging.getLogger(__name__)
+
+
+# Config: defaults, overridden by configs/default.yaml when present
+_CFG = {
+    "model_path": "models/qwen2.5-0.5b-instruct-q4_k_m.gguf",
+    "embed_model": "sentence-transformers/all-MiniLM-L6-v2",
+    "faiss_dir": "faiss_index",
+    "chunk_size": 1000,
+    "chunk_overlap": 200,
+    "embed_precision": "fp32",
+    "embed_batch_size": 64,
+    "embed_max_seq_length": 256,
+    **get_config(),
+}
 
-# Load config
-CFG_PATH = Path(__file__).resolve().parent.parent.parent / "configs" / "default.yaml"
-if CFG_PATH.exists():
-    with open(CFG_PATH, "r") as f:
-        _CFG = yaml.safe_load(f)
-else:
-    _CFG = {
-        "model_path": "models/qwen2.5-0.5b-instruct-q4_0.gguf",
-        "embed_model": "sentence-transformers/all-MiniLM-L6-v2",
-        "faiss_dir": "faiss_index",
-        "chunk_size": 1000,
-        "chunk_overlap": 200
-    }
+
+# RAG prompt: PROMPT_PREFIX + context + QUESTION_SEP + " " + question + ANSWER_SEP.
+# The fixed preamble comes first so llama.cpp's prompt cache can reuse its KV state.
+PROMPT_PREFIX = "You are an assistant. Use the context to answer the question.\n\nCONTEXT:\n"
+QUESTION_SEP = "\n\nQUESTION:"
+ANSWER_SEP = "\n\nANSWER:"
 
 
 class ModelLoader:
@@ -36,11 +72,24 @@ class ModelLoader:
         embed_model_name: Optional[str] = None,
         faiss_dir: Optional[str] = None,
         n_ctx: int = 2048,  # 0.5B models cannot handle 4k context well
+        query_cache_size: int = 4096,
+        embed_precision: Optional[str] = None,  # "fp32", "bf16" or "int8" (CPU); fp16 on CUDA
+        prompt_cache_bytes: int = 256 << 20,
     ):
         self.model_path = Path(model_path or _CFG.get("model_path"))
         self.embed_model_name = embed_model_name or _CFG.get("embed_model")
         self.faiss_dir = Path(faiss_dir or _CFG.get("faiss_dir"))
         self.n_ctx = n_ctx
+        self.embed_precision = (embed_precision or _CFG.get("embed_precision") or "fp32").lower()
+        self.embed_batch_size = int(_CFG.get("embed_batch_size", 64))
+        self.embed_max_seq_length = int(_CFG.get("embed_max_seq_length", 256))
+        self.prompt_cache_bytes = prompt_cache_bytes
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # llama.cpp contexts are not thread-safe; one generation at a time
+        self._llm_lock = threading.Lock()
+        self._prompt_spans: Optional[Tuple[List[int], List[int], List[int]]] = None
 
         self.llm = None
         self.embedder = None
@@ -51,29 +100,98 @@ class ModelLoader:
 
     def _load_llm(self):
         if not self.model_path.exists():
-            print(f"[WARN] LLM model not found: {self.model_path}")
+            logger.warning("LLM model not found: %s", self.model_path)
             return None
 
         if Llama is None:
-            print("[WARN] llama-cpp-python missing.")
+            logger.warning("llama-cpp-python missing.")
             return None
 
-        print(f"[INFO] Loading local LLM: {self.model_path}")
+        logger.info("Loading local LLM: %s", self.model_path)
 
-        return Llama(
+        llm = Llama(
             model_path=str(self.model_path),
             n_ctx=self.n_ctx,
-            n_threads=4,
-            n_gpu_layers=0
+            n_threads=os.cpu_count() or 4,
+            n_batch=512,
+            n_gpu_layers=self._gpu_layers(),
+            # GGUF weights are mapped, not copied into RSS; don't pin them
+            use_mmap=True,
+            use_mlock=False,
         )
+        # Reuse the KV state of prompts sharing a prefix (the fixed RAG preamble).
+        if LlamaRAMCache is not None:
+            llm.set_cache(LlamaRAMCache(capacity_bytes=self.prompt_cache_bytes))
+        return llm
+
+    @staticmethod
+    def _gpu_layers() -> int:
+        """All layers (-1) when llama.cpp was built with CUDA/Metal, else none."""
+        if llama_supports_gpu_offload is None:
+            return 0
+        try:
+            return -1 if llama_supports_gpu_offload() else 0
+        except Exception:
+            return 0
 
     def _load_embedder(self):
         if SentenceTransformer is None:
-            print("[WARN] sentence-transformers missing.")
+            logger.warning("sentence-transformers missing.")
             return None
 
-        print(f"[INFO] Loading embedder: {self.embed_model_name}")
-        return SentenceTransformer(self.embed_model_name)
+        device = self._embed_device()
+        logger.info("Loading embedder: %s on %s", self.embed_model_name, device)
+        embedder = SentenceTransformer(self.embed_model_name, device=device)
+        # chunks are ~1000 chars (~250 tokens); don't pad/attend past that
+        embedder.max_seq_length = self.embed_max_seq_length
+        if device == "cuda":
+            # fp16 on GPU; the CPU precision modes (IPEX bf16, dynamic int8) don't apply
+            embedder.half()
+            self.embed_precision = "fp16"
+            return embedder
+        return self._apply_precision(embedder)
+
+    @staticmethod
+    def _embed_device() -> str:
+        """CUDA if available, then Apple MPS, else CPU."""
+        if torch is None:
+            return "cpu"
+        if torch.cuda.is_available():
+            return "cuda"
+        mps = getattr(torch.backends, "mps", None)
+        if mps is not None and mps.is_available():
+            return "mps"
+        return "cpu"
+
+    def _apply_precision(self, embedder):
+        """
+        Lower the transformer's precision on CPU. "int8" applies dynamic
+        quantization to the Linear layers; "bf16" uses IPEX when installed and
+        otherwise relies on autocast inside embed().
+        """
+        if self.embed_precision == "fp32":
+            return embedder
+        if torch is None:
+            logger.warning("torch missing, embedder stays fp32.")
+            self.embed_precision = "fp32"
+            return embedder
+
+        transformer = embedder._first_module()
+        if self.embed_precision == "int8":
+            logger.info("Quantizing embedder Linear layers to INT8")
+            transformer.auto_model = torch.quantization.quantize_dynamic(
+                transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        elif self.embed_precision == "bf16":
+            if ipex is not None:
+                logger.info("Optimizing embedder for BF16 with IPEX")
+                transformer.auto_model = ipex.optimize(
+                    transformer.auto_model.eval(), dtype=torch.bfloat16
+                )
+        else:
+            logger.warning("Unknown embed_precision %r, using fp32.", self.embed_precision)
+            self.embed_precision = "fp32"
+        return embedder
 
     def _load_all(self):
         self.llm = self._load_llm()
@@ -83,24 +201,147 @@ class ModelLoader:
     def embed(self, texts: List[str]):
         if self.embedder is None:
             raise RuntimeError("Embedder is missing.")
-        return self.embedder.encode(texts, show_progress_bar=False)
+        # One encode call per batch of texts; sentence-transformers already sorts
+        # by length internally to minimise padding. Vectors come back unit-norm.
+        kwargs = dict(
+            batch_size=self.embed_batch_size,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        )
+        if self.embed_precision == "bf16":
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                out = self.embedder.encode(texts, convert_to_tensor=True, **kwargs)
+            return self._unit_float32(out.float().cpu().numpy())
+        vecs = self.embedder.encode(texts, convert_to_numpy=True, **kwargs)
+        if self.embed_precision == "fp16":
+            return self._unit_float32(vecs.astype(np.float32))
+        return vecs
+
+    @staticmethod
+    def _unit_float32(vecs: np.ndarray) -> np.ndarray:
+        # normalized in 16 bits (~3 significant digits); redo it in float32 so
+        # inner-product scores stay comparable with fp32-indexed vectors
+        vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Embed a single query as a (1, dim) array. Results are kept in an LRU
+        keyed by sha1(text), so repeated questions skip the encoder entirely.
+        """
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        with self._query_cache_lock:
+            vec = self._query_cache.get(key)
+            if vec is not None:
+                self._query_cache.move_to_end(key)
+                return vec
 
-    def chat(self, prompt: str, max_tokens: int = 256) -> str:
+        vec = np.asarray(self.embed([text]))
+        vec.setflags(write=False)
+        with self._query_cache_lock:
+            self._query_cache[key] = vec
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vec
+
+    def _tokenize(self, text: str, add_bos: bool = False) -> List[int]:
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=add_bos)
+
+    def rag_prompt_tokens(self, query: str, context: str) -> List[int]:
+        """
+        Token ids of the RAG prompt. The fixed spans are tokenized once per
+        model; only the context and the question are tokenized per call.
+        """
+        if self._prompt_spans is None:
+            self._prompt_spans = (
+                self._tokenize(PROMPT_PREFIX, add_bos=True),
+                self._tokenize(QUESTION_SEP),
+                self._tokenize(ANSWER_SEP),
+            )
+        prefix, question_sep, answer_sep = self._prompt_spans
+        return (
+            prefix
+            + self._tokenize(context)
+            + question_sep
+            + self._tokenize(" " + query)
+            + answer_sep
+        )
+
+    def chat(self, prompt: Union[str, List[int]], max_tokens: int = 256) -> str:
         if not self.llm:
             return "[Local LLM missing — place a .gguf model inside models/]"
 
-        out = self.llm(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=0.7,
-            top_p=0.9,
-            echo=False
-        )
+        with self._llm_lock:
+            out = self.llm(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                top_p=0.9,
+                echo=False
+            )
 
         try:
             return out["choices"][0]["text"].strip()
         except Exception:
             return str(out)
 
-    def answer_from_rag(self, query: str, max_tokens: int = 256) -> str:
-        return self.chat(query, max_tokens=max_tokens)
+    async def achat(self, prompt: Union[str, List[int]], max_tokens: int = 256) -> str:
+        """chat() in a worker thread, so an event loop keeps serving meanwhile."""
+        return await asyncio.to_thread(self.chat, prompt, max_tokens=max_tokens)
+
+    def stream_chat(self, prompt: Union[str, List[int]], max_tokens: int = 256) -> Iterator[str]:
+        """
+        Same as chat(), but yields text pieces as llama.cpp produces them.
+        Generation runs in a worker thread that holds the llm lock and queues
+        the pieces, so a slow consumer (e.g. an SSE client) never holds the
+        lock itself; closing the generator stops generation at the next token.
+        """
+        if not self.llm:
+            yield "[Local LLM missing — place a .gguf model inside models/]"
+            return
+
+        pieces: "queue.Queue[Union[str, BaseException, None]]" = queue.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                with self._llm_lock:
+                    for out in self.llm(
+                        prompt,
+                        max_tokens=max_tokens,
+                        temperature=0.7,
+                        top_p=0.9,
+                        echo=False,
+                        stream=True
+                    ):
+                        if stop.is_set():
+                            break
+                        text = out["choices"][0].get("text", "")
+                        if text:
+                            pieces.put(text)
+            except BaseException as e:
+                pieces.put(e)
+            finally:
+                pieces.put(None)
+
+        threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+        try:
+            while True:
+                item = pieces.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def answer_from_rag(self, query: str, context: str = "", max_tokens: int = 256) -> str:
+        if not self.llm:
+            return self.chat(query, max_tokens=max_tokens)
+        return self.chat(self.rag_prompt_tokens(query, context), max_tokens=max_tokens)
+
+    def stream_answer_from_rag(self, query: str, context: str = "", max_tokens: int = 256) -> Iterator[str]:
+        if not self.llm:
+            return self.stream_chat(query, max_tokens=max_tokens)
+        return self.stream_chat(self.rag_prompt_tokens(query, context), max_tokens=max_tokens)
@@ -3,11 +3,19 @@ multi_doc_chat/rag_service.py
 RAG service using ModelLoader, FAISS, and local embeddings.
 """
 
+from functools import lru_cache
+from math import isqrt
 from pathlib import Path
-from typing import List, Optional
-import yaml
+from typing import Iterator, List, Optional
+import threading
 
+from ._config import get_config
+from .dedup import SeenChunks
+from .document_store import DocumentStore
 from .model_loader import ModelLoader
+from .semantic_cache import SemanticCache
+from .utils.rwlock import RWLock
+from .vector_journal import VectorJournal
 
 try:
     import faiss
@@ -19,13 +27,40 @@ ROOT_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_FAISS_DIR = ROOT_DIR / "faiss_index"
 MODELS_DIR = ROOT_DIR / "models"
 
-# load config
-CFG_PATH = ROOT_DIR / "configs" / "default.yaml"
-if CFG_PATH.exists():
-    with open(CFG_PATH, "r") as f:
-        _CFG = yaml.safe_load(f)
-else:
-    _CFG = {"faiss_dir": str(DEFAULT_FAISS_DIR)}
+_CFG = get_config()
+
+# Small corpora use an exhaustive index built from INDEX_FACTORY: "SQ8" (one
+# byte per dimension, 4x smaller than float32), "Flat" (exact float32) or any
+# FAISS factory string (e.g. "SQfp16", half the size of float32). Past
+# ANN_MIN_VECTORS an exhaustive index is rebuilt as OPQ + IVF (HNSW coarse
+# quantizer) + PQ. All use the inner-product metric on unit-norm embeddings
+# (see ModelLoader.embed).
+INDEX_FACTORY = "SQ8"
+# A scalar quantizer trained on fewer vectors than this gets its min/max range
+# widened by SQ_RANGE_MARGIN (fraction of the range per side), so later vectors
+# are not clipped to the extremes of a small first batch.
+SQ_MIN_TRAIN = 10_000
+SQ_RANGE_MARGIN = 0.1
+ANN_MIN_VECTORS = 5000
+# "{nlist}" is filled in at build time: 4 * sqrt(N) lists, capped at ANN_MAX_NLIST.
+# Training uses at most max(ANN_MIN_TRAIN, 39 * nlist) vectors (FAISS's rule of thumb).
+ANN_FACTORY = "OPQ32_64,IVF{nlist}_HNSW32,PQ32x8"
+ANN_MAX_NLIST = 4096
+ANN_MIN_TRAIN = 10_000
+ANN_NPROBE = 16
+
+# index.bin is rewritten once this many vectors were added since the last save
+# (and on shutdown). Vectors added in between are appended to index.journal and
+# replayed on the next load; docs missing from both are re-embedded.
+INDEX_CHECKPOINT_EVERY = 1024
+
+# Retrieval results are reused for near-identical queries (cosine >= threshold).
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_THRESHOLD = 0.97
+
+# Whole answers are reused for near-identical questions, skipping generation.
+QA_CACHE_SIZE = 1024
+QA_CACHE_THRESHOLD = 0.95
 
 class RAGService:
     def __init__(self, model_loader: Optional[ModelLoader] = None, faiss_dir: Optional[str] = None):
@@ -33,66 +68,312 @@ class RAGService:
         self.faiss_dir = Path(cfg_faiss)
         self.faiss_dir.mkdir(parents=True, exist_ok=True)
         self.loader = model_loader or ModelLoader(faiss_dir=str(self.faiss_dir))
-        self.documents: List[str] = self.loader.documents or []
+        # chunk texts, memory-mapped from docs.bin/docs.idx
+        self.documents = DocumentStore(self.faiss_dir)
+        # digests of indexed chunks; re-uploaded chunks are not embedded again
+        self._seen = SeenChunks(self.faiss_dir / "seen.sqlite")
+        if not len(self.documents):
+            self._seen.clear()
         self.index = None
+        # searches share the index; ingest takes it exclusively for add/persist
+        self._rw = RWLock()
+        self.index_factory = _CFG.get("index_factory", INDEX_FACTORY)
+        self.ann_min_vectors = int(_CFG.get("ann_min_vectors", ANN_MIN_VECTORS))
+        self.ann_factory = _CFG.get("ann_factory", ANN_FACTORY)
+        self.nprobe = int(_CFG.get("nprobe", ANN_NPROBE))
+        self.pdf_backend = _CFG.get("pdf_backend", "auto")
+        self.checkpoint_every = int(_CFG.get("index_checkpoint_every", INDEX_CHECKPOINT_EVERY))
+        self._unsaved = 0
+        self._journal = VectorJournal(self.faiss_dir / "index.journal")
+        # held while an IVF-PQ index is trained, so only one thread trains
+        self._ann_build = threading.Lock()
+        # documents[:_indexed] have vectors in the index; FAISS ids are positions
+        self._indexed = 0
+        self._search_cache = SemanticCache(
+            capacity=int(_CFG.get("search_cache_size", SEARCH_CACHE_SIZE)),
+            threshold=float(_CFG.get("search_cache_threshold", SEARCH_CACHE_THRESHOLD)),
+        )
+        self._qa_cache = SemanticCache(
+            capacity=int(_CFG.get("qa_cache_size", QA_CACHE_SIZE)),
+            threshold=float(_CFG.get("qa_cache_threshold", QA_CACHE_THRESHOLD)),
+        )
+        # bumped on every ingest; answers computed against an older corpus are not cached
+        self._corpus_version = 0
         if faiss:
             self._try_load_index()
 
     def _try_load_index(self):
         idx_path = self.faiss_dir / "index.bin"
-        docs_path = self.faiss_dir / "docs.txt"
         if idx_path.exists() and faiss:
             self.index = faiss.read_index(str(idx_path))
-            if docs_path.exists():
-                with open(docs_path, "r", encoding="utf-8") as f:
-                    self.documents = [line.rstrip("\n") for line in f.readlines()]
+            self._indexed = min(self.index.ntotal, len(self.documents))
+            self._migrate_flat_l2()
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is not None:
+                ivf.nprobe = self.nprobe
+        self._replay_journal()
+        self._index_missing_documents()
+        self._maybe_build_ann()
+
+    def _replay_journal(self):
+        """Add the journaled vectors of documents indexed after the last checkpoint."""
+        vecs = self._journal.read(self._indexed, len(self.documents) - self._indexed)
+        if not len(vecs):
+            return
+        self._add_vectors(vecs, journal=False)
+
+    def _add_vectors(self, vecs, journal: bool = True):
+        """Index vecs as ids _indexed, _indexed + 1, ... and journal them."""
+        if self.index is None:
+            self.index = self._new_index(vecs)
+        self.index.add(vecs)
+        if journal:
+            self._journal.append(self._indexed, vecs)
+        self._indexed += len(vecs)
+        self._unsaved += len(vecs)
+
+    def _new_index(self, vectors):
+        """
+        Empty index of the configured ``index_factory`` kind, trained on
+        ``vectors`` (the first batch) when the kind needs training.
+        """
+        # embeddings are unit-norm, so inner product == cosine similarity
+        dim = vectors.shape[1]
+        if self.index_factory == "Flat":
+            index = faiss.IndexFlatIP(dim)
+        elif self.index_factory == "SQ8":
+            index = faiss.IndexScalarQuantizer(
+                dim, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            index = faiss.index_factory(dim, self.index_factory, faiss.METRIC_INNER_PRODUCT)
+        if isinstance(index, faiss.IndexScalarQuantizer) and len(vectors) < SQ_MIN_TRAIN:
+            index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            index.sq.rangestat_arg = SQ_RANGE_MARGIN
+        if not index.is_trained:
+            index.train(vectors)
+        return index
+
+    def _migrate_flat_l2(self):
+        """
+        Rebuild an IndexFlatL2 written by older versions as IndexFlatIP, once.
+        Trained (IVF-PQ) L2 indexes are left alone: on unit vectors the L2 and
+        inner-product rankings are identical and retraining is not free.
+        """
+        if not isinstance(self.index, faiss.IndexFlat) or self.index.metric_type != faiss.METRIC_L2:
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        faiss.normalize_L2(vectors)
+        index = self._new_index(vectors)
+        index.add(vectors)
+        self.index = index
+        self._unsaved = max(self._unsaved, index.ntotal)
+
+    def _index_missing_documents(self):
+        """
+        Embed documents persisted after the last index checkpoint (e.g. the
+        process was killed before shutdown), keeping the index a prefix of
+        self.documents so FAISS ids stay equal to document positions.
+        """
+        if self._indexed >= len(self.documents) or self.loader.embedder is None:
+            return
+        missing = self.documents[self._indexed:]
+        vecs = self.loader.embed(missing).astype("float32", copy=False)
+        self._add_vectors(vecs)
+
+    def checkpoint(self):
+        """Write index.bin if vectors were added since the last save."""
+        with self._rw.writer():
+            if self._unsaved:
+                self._save_index()
+
+    def _save_index(self):
+        faiss.write_index(self.index, str(self.faiss_dir / "index.bin"))
+        # a journal left behind by a crash here is skipped on load by its base id
+        self._journal.reset()
+        self._unsaved = 0
 
     def ingest_documents(self, texts: List[str]):
         if not texts:
             return
-        # extend docs
-        self.documents.extend(texts)
-
         if self.loader.embedder is None:
             raise RuntimeError("Embedding model not loaded.")
 
-        embeddings = self.loader.embed(texts).astype("float32")
+        texts, digests = self._seen.filter_new(texts)
+        if not texts:
+            return
+
+        # embedding is the slow part and needs no lock
+        embeddings = self.loader.embed(texts).astype("float32", copy=False)
         if faiss is None:
             raise RuntimeError("faiss not available (install faiss-cpu)")
 
-        if self.index is None:
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
+        with self._rw.writer():
+            # a concurrent ingest may have indexed some of these meanwhile
+            known = self._seen.known(digests)
+            if known:
+                keep = [i for i, d in enumerate(digests) if d not in known]
+                if not keep:
+                    return
+                texts = [texts[i] for i in keep]
+                digests = [digests[i] for i in keep]
+                embeddings = embeddings[keep]
+            self._index_missing_documents()
+            # extend docs
+            self.documents.extend(texts)
+            self._search_cache.clear()
+            self._qa_cache.clear()
+            self._corpus_version += 1
 
-        self.index.add(embeddings)
-        # persist
-        idx_path = self.faiss_dir / "index.bin"
-        docs_path = self.faiss_dir / "docs.txt"
-        faiss.write_index(self.index, str(idx_path))
-        with open(docs_path, "w", encoding="utf-8") as f:
-            for d in self.documents:
-                f.write(d.replace("\n", " ")+"\n")
+            self._add_vectors(embeddings)
+            # persist: docs and journal every time, the index every checkpoint_every vectors
+            if self._unsaved >= self.checkpoint_every:
+                self._save_index()
+            self.documents.save()
+            self._seen.add(digests)
+        self._maybe_build_ann()
+
+    def _maybe_build_ann(self):
+        """
+        Replace the exhaustive (Flat/SQ8) index with a trained IVF-PQ index
+        once the corpus reaches ``ann_min_vectors``. This happens once: nlist
+        is sized from the corpus at that point and is not revisited as the
+        corpus keeps growing (the raw vectors are gone by then, so retraining
+        would start from PQ-decoded ones).
+
+        Training runs without the index lock, on a snapshot of the vectors
+        (SQ8 ones are decoded, slightly lossy), so searches keep using the
+        exhaustive index meanwhile. Vectors ingested during training are
+        copied over when the new index is swapped in and checkpointed under
+        the writer lock. Call without holding ``self._rw``.
+        """
+        if not self._ann_build.acquire(blocking=False):
+            return  # another thread is already training
+        try:
+            with self._rw.reader():
+                if not isinstance(self.index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+                    return
+                n = self.index.ntotal
+                if n < self.ann_min_vectors:
+                    return
+                dim = self.index.d
+                vectors = self.index.reconstruct_n(0, n)
+
+            index = self._train_ann(vectors, dim)
+
+            with self._rw.writer():
+                late = self.index.ntotal - n
+                if late:
+                    index.add(self.index.reconstruct_n(n, late))
+                self.index = index
+                self._search_cache.clear()
+                # the rebuilt index is always worth a checkpoint
+                self._save_index()
+        finally:
+            self._ann_build.release()
+
+    def _train_ann(self, vectors, dim: int):
+        """IVF-PQ index with 4 * sqrt(N) lists, trained on a sample of ``vectors``."""
+        n = len(vectors)
+        nlist = max(1, min(ANN_MAX_NLIST, 4 * isqrt(n)))
+        factory = self.ann_factory.format(nlist=nlist)
+        n_train = max(ANN_MIN_TRAIN, 39 * nlist)
+        step = max(1, -(-n // n_train))  # ceil, so the sample is <= n_train
+        index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors[::step])
+        index.add(vectors)
+        faiss.extract_index_ivf(index).nprobe = self.nprobe
+        return index
 
     def search(self, query: str, top_k: int = 3):
         if self.index is None:
             return []
-        q_vec = self.loader.embed([query]).astype("float32")
-        distances, indices = self.index.search(q_vec, top_k)
-        results = []
-        for idx in indices[0]:
-            if 0 <= idx < len(self.documents):
-                results.append(self.documents[idx])
+        q_vec = self.loader.embed_query(query).astype("float32", copy=False)
+        with self._rw.reader():
+            # one entry per query, holding its results for each top_k
+            by_top_k = self._search_cache.get(q_vec)
+            if by_top_k is not None and top_k in by_top_k:
+                return list(by_top_k[top_k])
+            distances, indices = self.index.search(q_vec, top_k)
+            idx = indices[0]
+            docs = self.documents
+            # FAISS pads missing hits with -1
+            hits = idx[(idx >= 0) & (idx < len(docs))].tolist()
+            results = [docs[i] for i in hits]
+            if by_top_k is None:
+                self._search_cache.put(q_vec, {top_k: tuple(results)})
+            else:
+                by_top_k[top_k] = tuple(results)
         return results
 
-    def query(self, question: str, top_k: int = 3, max_tokens: int = 256) -> str:
-        # retrieve
+    def _retrieve_context(self, question: str, top_k: int) -> str:
+        # retrieve; the prompt itself is assembled (pre-tokenized) by the loader
         chunks = self.search(question, top_k=top_k)
-        context = "\n\n".join(chunks)
-        prompt = f"You are an assistant. Use the context to answer the question.\n\nCONTEXT:\n{context}\n\nQUESTION: {question}\n\nANSWER:"
-        return self.loader.answer_from_rag(prompt, max_tokens=max_tokens)
+        return "\n\n".join(chunks)
+
+    def _qa_probe(self, question: str):
+        """Query embedding for the answer cache, or None when it cannot apply."""
+        if self.index is None or self.loader.embedder is None:
+            return None
+        return self.loader.embed_query(question)
+
+    def _qa_lookup(self, q_vec, top_k: int, max_tokens: int) -> Optional[str]:
+        """Cached answer generated with the same top_k and max_tokens, if any."""
+        if q_vec is None:
+            return None
+        answers = self._qa_cache.get(q_vec)
+        return answers.get((top_k, max_tokens)) if answers is not None else None
+
+    def _qa_store(self, q_vec, version: int, top_k: int, max_tokens: int, answer: str):
+        # don't cache the "LLM missing" placeholder or answers that raced an ingest
+        if q_vec is None or not self.loader.llm or version != self._corpus_version:
+            return
+        # one entry per question, holding its answer for each (top_k, max_tokens)
+        answers = self._qa_cache.get(q_vec)
+        if answers is None:
+            self._qa_cache.put(q_vec, {(top_k, max_tokens): answer})
+        else:
+            answers[(top_k, max_tokens)] = answer
+
+    def query(self, question: str, top_k: int = 3, max_tokens: int = 256) -> str:
+        version = self._corpus_version
+        q_vec = self._qa_probe(question)
+        cached = self._qa_lookup(q_vec, top_k, max_tokens)
+        if cached is not None:
+            return cached
+
+        context = self._retrieve_context(question, top_k)
+        answer = self.loader.answer_from_rag(question, context=context, max_tokens=max_tokens)
+        self._qa_store(q_vec, version, top_k, max_tokens, answer)
+        return answer
+
+    def query_stream(self, question: str, top_k: int = 3, max_tokens: int = 256) -> Iterator[str]:
+        version = self._corpus_version
+        q_vec = self._qa_probe(question)
+        cached = self._qa_lookup(q_vec, top_k, max_tokens)
+        if cached is not None:
+            yield cached
+            return
+
+        context = self._retrieve_context(question, top_k)
+        parts = []
+        for piece in self.loader.stream_answer_from_rag(question, context=context, max_tokens=max_tokens):
+            parts.append(piece)
+            yield piece
+        self._qa_store(q_vec, version, top_k, max_tokens, "".join(parts).strip())
 
 
 def create_rag_service(faiss_dir: str = str(DEFAULT_FAISS_DIR)) -> RAGService:
     loader = ModelLoader()
     rs = RAGService(model_loader=loader, faiss_dir=faiss_dir)
     return rs
+
+
+@lru_cache(maxsize=None)
+def get_rag_service(faiss_dir: str = str(DEFAULT_FAISS_DIR)) -> RAGService:
+    """
+    Process-wide RAGService per faiss_dir. Entry points use this so that
+    re-importing the app module (``python app.py`` followed by uvicorn
+    importing ``app:app``) does not load the models a second time.
+    """
+    return create_rag_service(faiss_dir=faiss_dir)
@@ -0,0 +1,70 @@
+"""
+multi_doc_chat/semantic_cache.py
+Small in-memory cache looked up by cosine similarity of query embeddings.
+"""
+
+from typing import Any, List, Optional
+import threading
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Fixed-capacity FIFO of (embedding, value) pairs. ``get`` returns the value
+    of the most similar stored embedding if its cosine similarity to the probe
+    is at least ``threshold``. Safe to share between threads.
+    """
+
+    def __init__(self, capacity: int = 512, threshold: float = 0.97):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vecs: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _unit(vec) -> Optional[np.ndarray]:
+        v = np.asarray(vec, dtype="float32").reshape(-1)
+        norm = float(np.linalg.norm(v))
+        if norm == 0.0:
+            return None
+        return v / norm
+
+    def get(self, vec) -> Optional[Any]:
+        v = self._unit(vec)
+        if v is None:
+            return None
+        with self._lock:
+            if not self._values or v.shape[0] != self._vecs.shape[1]:
+                return None
+            sims = self._vecs[: len(self._values)] @ v
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                return self._values[best]
+        return None
+
+    def put(self, vec, value: Any) -> None:
+        v = self._unit(vec)
+        if v is None:
+            return
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != v.shape[0]:
+                self._vecs = np.zeros((self.capacity, v.shape[0]), dtype="float32")
+                self._values = []
+                self._next = 0
+            self._vecs[self._next] = v
+            if len(self._values) < self.capacity:
+                self._values.append(value)
+            else:
+                self._values[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vecs = None
+            self._values = []
+            self._next = 0
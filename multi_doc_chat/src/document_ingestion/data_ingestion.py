@@ -1,28 +1,30 @@
+import asyncio
 from typing import List
 from ...utils.document_ops import pdf_to_text_fileobj, read_text_fileobj, chunk_text
 
+async def _extract_one(f, pdf_backend: str) -> str:
+    fname = (getattr(f, "filename", None) or getattr(f, "name", "")).lower()
+    # PDF
+    if fname.endswith(".pdf"):
+        return await pdf_to_text_fileobj(f, backend=pdf_backend)
+    return await read_text_fileobj(f)
+
 async def ingest_upload_files(upload_files: List, rag_service) -> str:
     """
     Accepts UploadFile-like objects (FastAPI UploadFile or Gradio file objects)
     Returns session_id.
     """
-    all_chunks = []
-    for f in upload_files:
-        fname = (getattr(f, "filename", None) or getattr(f, "name", "")).lower()
-        # PDF
-        if fname.endswith(".pdf"):
-            text = await pdf_to_text_fileobj(f)
-        else:
-            text = await read_text_fileobj(f)
-        chunks = chunk_text(text)
-        if not chunks:
-            chunks = [text]
-        all_chunks.extend(chunks)
+    # extract every file concurrently; PDF pages already fan out to the process pool
+    pdf_backend = getattr(rag_service, "pdf_backend", "auto")
+    texts = await asyncio.gather(*(_extract_one(f, pdf_backend) for f in upload_files))
+
+    # files without text (e.g. scanned PDFs) contribute no chunks
+    all_chunks = [chunk for text in texts for chunk in chunk_text(text)]
 
     if not all_chunks:
         raise ValueError("No readable text extracted.")
 
-    # ingest (update the shared RAG instance)
-    rag_service.ingest_documents(all_chunks)
+    # ingest (update the shared RAG instance) off the event loop, in one batch
+    await asyncio.to_thread(rag_service.ingest_documents, all_chunks)
 
     return "default"
@@ -3,35 +3,141 @@ document_ops.py
 Utilities for reading PDFs/TXT and chunking text.
 """
 
-from io import BytesIO
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from PyPDF2 import PdfReader
 
-async def pdf_to_text_fileobj(fileobj) -> str:
-    data = BytesIO(await fileobj.read())
-    reader = PdfReader(data)
-    pages = []
-    for p in reader.pages:
-        pages.append(p.extract_text() or "")
-    return "\n".join(pages)
-
-def read_text_fileobj(fileobj) -> str:
-    fileobj.file.seek(0)
-    b = fileobj.file.read()
+try:
+    import pypdfium2 as pdfium
+except Exception:
+    pdfium = None
+
+# PDFs shorter than this are extracted in-process; forking is not worth it.
+PARALLEL_MIN_PAGES = 4
+
+# Uploads are copied to disk in reads of this size instead of one big read().
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        _PDF_POOL = ProcessPoolExecutor(max_workers=_cpu_count())
+    return _PDF_POOL
+
+def _page_shards(n_pages: int, n_shards: int) -> List[range]:
+    """Split page indices into at most n_shards contiguous, ordered ranges."""
+    n_shards = max(1, min(n_shards, n_pages))
+    size, extra = divmod(n_pages, n_shards)
+    shards, start = [], 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(range(start, end))
+        start = end
+    return shards
+
+def _extract_pages(path: str, pages: Optional[range] = None) -> List[str]:
+    """Extract text for the given pages (all when None). Also the pool worker."""
+    with open(path, "rb") as fh:
+        reader = PdfReader(fh)
+        if pages is None:
+            pages = range(len(reader.pages))
+        return [reader.pages[i].extract_text() or "" for i in pages]
+
+def _count_pages(path: str) -> int:
+    with open(path, "rb") as fh:
+        return len(PdfReader(fh).pages)
+
+def _pdfium_to_text(path: str) -> str:
+    """Extract all pages with PDFium. Also the pool worker (PDFium is not thread-safe)."""
+    if pdfium is None:
+        raise RuntimeError("pypdfium2 not available (install pypdfium2)")
+    pdf = pdfium.PdfDocument(path)
+    try:
+        texts = []
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return "\n".join(texts)
+    finally:
+        pdf.close()
+
+def _resolve_backend(backend: str) -> str:
+    if backend == "auto":
+        return "pdfium" if pdfium is not None else "pypdf2"
+    return backend
+
+async def _spool_upload(fileobj, suffix: str = "") -> str:
+    """Copy an upload to a temp file in UPLOAD_CHUNK_SIZE reads; returns its path."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await fileobj.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+async def pdf_to_text_fileobj(fileobj, backend: str = "auto") -> str:
+    """
+    Extract text from an uploaded PDF. The upload is streamed to a temp file
+    and parsed from disk off the event loop. backend="pdfium" (the "auto"
+    choice when pypdfium2 is installed) parses the whole file in a pool
+    process, so concurrent uploads run in parallel; with "pypdf2" the pages
+    of one file are sharded across the pool instead.
+    """
+    path = await _spool_upload(fileobj, suffix=".pdf")
+    try:
+        loop = asyncio.get_running_loop()
+        if _resolve_backend(backend) == "pdfium":
+            return await loop.run_in_executor(_get_pdf_pool(), _pdfium_to_text, path)
+
+        n_pages = await asyncio.to_thread(_count_pages, path)
+        shards = _page_shards(n_pages, _cpu_count())
+        if n_pages < PARALLEL_MIN_PAGES or len(shards) < 2:
+            return "\n".join(await asyncio.to_thread(_extract_pages, path))
+
+        pool = _get_pdf_pool()
+        parts = await asyncio.gather(
+            *(loop.run_in_executor(pool, _extract_pages, path, shard) for shard in shards)
+        )
+        return "\n".join(text for part in parts for text in part)
+    finally:
+        os.unlink(path)
+
+async def read_text_fileobj(fileobj) -> str:
+    b = await fileobj.read()
     if isinstance(b, bytes):
         return b.decode("utf-8", errors="ignore")
     return str(b)
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """
+    Split text into chunk_size windows, each starting chunk_size - overlap
+    characters after the previous one. The last window is the first one that
+    reaches the end of the text; later starts would only repeat its tail.
+    """
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than chunk_size ({chunk_size})")
     if not text:
         return []
-    chunks = []
-    start = 0
-    L = len(text)
-    while start < L:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start = max(end - overlap, end)
-    return chunks
+    return [text[s:s + chunk_size] for s in range(0, max(len(text) - overlap, 1), step)]
@@ -0,0 +1,76 @@
+"""
+multi_doc_chat/vector_journal.py
+Append-only log of vectors added to the FAISS index since its last checkpoint.
+"""
+
+from pathlib import Path
+import os
+import numpy as np
+
+# header: int64 dim, int64 id of the first row
+_HEADER = np.dtype([("dim", "<i8"), ("base", "<i8")])
+
+
+class VectorJournal:
+    """
+    Raw float32 rows for FAISS ids ``base, base + 1, ...``, appended per
+    ingest so that vectors added after the last ``index.bin`` checkpoint
+    survive a restart without being re-embedded. Only a contiguous run of ids
+    is kept; an append that does not continue it starts a new journal.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.dim = 0
+        self.base = 0
+        self.rows = 0
+        if self.path.exists():
+            self._load_header()
+
+    def _load_header(self):
+        size = self.path.stat().st_size
+        if size < _HEADER.itemsize:
+            self.reset()
+            return
+        header = np.fromfile(self.path, dtype=_HEADER, count=1)[0]
+        self.dim, self.base = int(header["dim"]), int(header["base"])
+        # a torn final write leaves a partial row; it is ignored
+        self.rows = (size - _HEADER.itemsize) // (4 * self.dim) if self.dim else 0
+
+    @property
+    def end(self) -> int:
+        return self.base + self.rows
+
+    def append(self, start: int, vectors: np.ndarray):
+        """Record ``vectors`` as ids ``start, start + 1, ...``."""
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if not len(vectors):
+            return
+        if not self.rows or start != self.end or vectors.shape[1] != self.dim:
+            self._start(start, vectors.shape[1])
+        with open(self.path, "ab") as f:
+            f.write(vectors.tobytes())
+        self.rows += len(vectors)
+
+    def _start(self, base: int, dim: int):
+        header = np.array([(dim, base)], dtype=_HEADER)
+        with open(self.path, "wb") as f:
+            f.write(header.tobytes())
+        self.dim, self.base, self.rows = dim, base, 0
+
+    def read(self, start: int, limit: int) -> np.ndarray:
+        """Rows for ids ``start .. start + limit - 1`` that the journal holds."""
+        if limit <= 0 or not self.rows or not self.base <= start < self.end:
+            return np.empty((0, self.dim), dtype="float32")
+        count = min(limit, self.end - start)
+        offset = _HEADER.itemsize + (start - self.base) * 4 * self.dim
+        flat = np.fromfile(self.path, dtype="<f4", count=count * self.dim, offset=offset)
+        return flat.reshape(count, self.dim).astype("float32", copy=False)
+
+    def reset(self):
+        """Forget every row (the index they belong to was checkpointed)."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.dim = self.base = self.rows = 0
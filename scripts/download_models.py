@@ -1,43 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import logging
+import os
+import threading
 import requests
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
-SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
+logger = logging.getLogger(__name__)
 
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 MODELS_DIR = Path("models")
 MODELS_DIR.mkdir(exist_ok=True)
 
+# Written once every model is in place; warm starts skip all network checks.
+SENTINEL = MODELS_DIR / ".models_ready"
+
 MODEL_LIST = [
     {
-        "name": "qwen2.5-0.5b-instruct-q4_0",
-        "filename": "qwen2.5-0.5b-instruct-q4_0.gguf",
-        "url": "https://huggingface.co/Qwen/Qwen2.5-0.5B-Instruct-GGUF/resolve/main/qwen2.5-0.5b-instruct-q4_0.gguf"
+        "name": "qwen2.5-0.5b-instruct-q4_k_m",
+        "filename": "qwen2.5-0.5b-instruct-q4_k_m.gguf",
+        "url": "https://huggingface.co/Qwen/Qwen2.5-0.5B-Instruct-GGUF/resolve/main/qwen2.5-0.5b-instruct-q4_k_m.gguf"
     }
 ]
 
-def download_file(url: str, dest: Path):
-    if dest.exists():
-        return
-    resp = requests.get(url, stream=True)
-    content_type = resp.headers.get("content-type", "")
-    if "text/html" in content_type:
+# Large files are fetched as this many parallel Range requests (one connection
+# each); smaller files, or servers without byte ranges, use a single stream.
+DOWNLOAD_PARTS = 8
+PARALLEL_MIN_BYTES = 32 << 20
+DOWNLOAD_CHUNK = 1 << 20
+
+def _check_not_html(resp, url: str):
+    if "text/html" in resp.headers.get("content-type", ""):
         raise ValueError(f"URL returned HTML, not a model file: {url}")
-    total = int(resp.headers.get("content-length", 0))
-    with open(dest, "wb") as f, tqdm(total=total, unit="B", unit_scale=True, desc=dest.name) as bar:
-        for chunk in resp.iter_content(chunk_size=1024 * 1024):
+
+def _download_stream(url: str, path: Path, bar):
+    with requests.get(url, stream=True, timeout=60) as resp:
+        resp.raise_for_status()
+        _check_not_html(resp, url)
+        with open(path, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                if chunk:
+                    f.write(chunk)
+                    bar.update(len(chunk))
+
+def _download_range(url: str, fd: int, start: int, end: int, bar, stop: threading.Event):
+    """Fetch bytes [start, end] and pwrite them at their offset; give up once stop is set."""
+    headers = {"Range": f"bytes={start}-{end}"}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as resp:
+        if resp.status_code != 206:
+            raise ValueError(f"Range request not honoured (HTTP {resp.status_code}): {url}")
+        offset = start
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK):
+            if stop.is_set():
+                return
             if chunk:
-                f.write(chunk)
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
                 bar.update(len(chunk))
+    if offset != end + 1:
+        raise IOError(f"Incomplete range {start}-{end}: got {offset - start} bytes")
+
+def _download_parts(url: str, path: Path, total: int, bar):
+    size = -(-total // DOWNLOAD_PARTS)
+    ranges = [(s, min(s + size, total) - 1) for s in range(0, total, size)]
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, total)
+        else:
+            os.ftruncate(fd, total)
+        # the first failed part stops the others at their next chunk
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=len(ranges))
+        try:
+            futures = [pool.submit(_download_range, url, fd, s, e, bar, stop) for s, e in ranges]
+            for fut in as_completed(futures):
+                fut.result()
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        os.close(fd)
+
+def download_file(url: str, dest: Path):
+    if dest.exists():
+        return
+    # the HEAD follows redirects, so ranges go straight to the CDN URL
+    head = requests.head(url, allow_redirects=True, timeout=30)
+    head.raise_for_status()
+    _check_not_html(head, url)
+    total = int(head.headers.get("content-length", 0))
+    ranged = head.headers.get("accept-ranges", "").lower() == "bytes"
+
+    # written under .part and renamed, so an interrupted download is not
+    # mistaken for a finished model on the next start
+    part = dest.with_name(dest.name + ".part")
+    try:
+        with tqdm(total=total, unit="B", unit_scale=True, desc=dest.name) as bar:
+            if ranged and total >= PARALLEL_MIN_BYTES and hasattr(os, "pwrite"):
+                _download_parts(head.url, part, total, bar)
+            else:
+                _download_stream(url, part, bar)
+        os.replace(part, dest)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+
+def prefetch_embedder():
+    # populates the sentence-transformers cache; the instance is discarded
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer(EMBED_MODEL)
 
 def main():
+    if SENTINEL.exists() and all((MODELS_DIR / m["filename"]).exists() for m in MODEL_LIST):
+        return
+
+    ok = True
     for m in MODEL_LIST:
         dest = MODELS_DIR / m["filename"]
         try:
             download_file(m["url"], dest)
         except Exception as e:
-            print(f"Failed to download {m['name']}: {e}")
+            ok = False
+            logger.error("Failed to download %s: %s", m["name"], e)
+    try:
+        prefetch_embedder()
+    except Exception as e:
+        ok = False
+        logger.error("Failed to download %s: %s", EMBED_MODEL, e)
+
+    if ok:
+        SENTINEL.touch()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     main()
@@ -4,7 +4,7 @@ from unittest.mock import MagicMock
 import numpy as np
 
 class FakeEmbedder:
-    def encode(self, texts, show_progress_bar=False):
+    def encode(self, texts, show_progress_bar=False, **kwargs):
         return np.zeros((len(texts), 768), dtype="float32")
 
 @pytest.mark.asyncio
@@ -25,7 +25,7 @@ class DummyUploadFile:
 # Fake embedder (fast + deterministic)
 # -------------------------
 class FakeEmbedder:
-    def encode(self, texts, show_progress_bar=False):
+    def encode(self, texts, show_progress_bar=False, **kwargs):
         return np.zeros((len(texts), 384), dtype="float32")
 
 
@@ -74,6 +74,20 @@ async def test_ingest_txt_file(monkeypatch, tmp_path):
     # --- Ensure FAISS was called ---
     rag_service.index.add.assert_called_once()
 
+@pytest.mark.asyncio
+async def test_ingest_without_text_raises(monkeypatch, tmp_path):
+    rag_service = create_rag_service(faiss_dir=str(tmp_path))
+    rag_service.ingest_documents = MagicMock()
+
+    async def empty_read_text_fileobj(fileobj):
+        return ""
+
+    monkeypatch.setattr(di, "read_text_fileobj", empty_read_text_fileobj)
+
+    with pytest.raises(ValueError):
+        await di.ingest_upload_files([DummyUploadFile("a.txt", ""), DummyUploadFile("b.txt", "")], rag_service)
+    rag_service.ingest_documents.assert_not_called()
+
 @pytest.fixture(autouse=True)
 def no_threads(monkeypatch):
     async def fake_to_thread(func, *args, **kwargs):
@@ -0,0 +1,38 @@
+import pytest
+
+from multi_doc_chat.utils.document_ops import chunk_text
+
+
+def test_chunk_text_applies_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(25))
+    chunks = chunk_text(text, chunk_size=10, overlap=4)
+
+    assert chunks[0] == text[0:10]
+    assert chunks[1] == text[6:16]
+    assert chunks[1][:4] == chunks[0][-4:]
+    assert "".join(c[: 10 - 4] for c in chunks[:-1]) + chunks[-1] == text
+
+
+def test_chunk_text_has_no_tail_fragment():
+    text = "x" * 25
+    chunks = chunk_text(text, chunk_size=10, overlap=4)
+
+    assert [len(c) for c in chunks] == [10, 10, 10, 7]
+    assert chunk_text("short", chunk_size=10, overlap=4) == ["short"]
+
+
+def test_chunk_text_rejects_overlap_not_below_size():
+    with pytest.raises(ValueError):
+        chunk_text("abc", chunk_size=4, overlap=4)
+
+
+def test_chunk_text_empty():
+    assert chunk_text("") == []
+
+
+def test_page_shards_are_contiguous_and_ordered():
+    from multi_doc_chat.utils.document_ops import _page_shards
+
+    shards = _page_shards(10, 3)
+    assert [list(r) for r in shards] == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert len(_page_shards(2, 8)) == 2
@@ -0,0 +1,58 @@
+from multi_doc_chat.document_store import DocumentStore
+
+
+def test_round_trip_keeps_newlines_and_unicode(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.extend(["first\nchunk", "naïve café", ""])
+    store.save()
+    store.append("unsaved")
+
+    reloaded = DocumentStore(tmp_path)
+    assert list(reloaded) == ["first\nchunk", "naïve café", ""]
+    assert store[-1] == "unsaved"
+    assert store[1:3] == ["naïve café", ""]
+
+
+def test_migrates_legacy_docs_txt(tmp_path):
+    (tmp_path / "docs.txt").write_text("a\nb\n", encoding="utf-8")
+
+    store = DocumentStore(tmp_path)
+
+    assert list(store) == ["a", "b"]
+    assert not (tmp_path / "docs.txt").exists()
+    assert list(DocumentStore(tmp_path)) == ["a", "b"]
+
+
+def test_repeated_saves_keep_stored_chunks(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.extend(["one", "twö"])
+    store.save()
+    store.append("three")
+    store.save()
+    store.save()
+
+    assert list(DocumentStore(tmp_path)) == ["one", "twö", "three"]
+
+
+def test_save_appends_past_leftovers_of_an_interrupted_save(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.append("kept")
+    store.save()
+    with open(tmp_path / "docs.bin", "ab") as f:
+        f.write(b"torn write")
+
+    store = DocumentStore(tmp_path)
+    store.append("next")
+    store.save()
+
+    assert list(DocumentStore(tmp_path)) == ["kept", "next"]
+    assert (tmp_path / "docs.bin").read_bytes() == b"keptnext"
+
+
+def test_all_empty_store(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.extend(["", ""])
+    store.save()
+
+    assert store[0] == ""
+    assert list(DocumentStore(tmp_path)) == ["", ""]
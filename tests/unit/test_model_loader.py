@@ -0,0 +1,54 @@
+import asyncio
+
+from multi_doc_chat.model_loader import ModelLoader, PROMPT_PREFIX
+
+
+class FakeLlama:
+    def __init__(self):
+        self.tokenized = []
+        self.prompts = []
+
+    def tokenize(self, text: bytes, add_bos: bool = True):
+        self.tokenized.append(text.decode("utf-8"))
+        return [len(text)] if not add_bos else [0, len(text)]
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return {"choices": [{"text": " answer "}]}
+
+
+def test_rag_prompt_reuses_pretokenized_spans(tmp_path):
+    loader = ModelLoader(model_path=str(tmp_path / "missing.gguf"))
+    loader.llm = FakeLlama()
+
+    assert loader.answer_from_rag("q1", context="ctx") == "answer"
+    assert loader.answer_from_rag("q2", context="ctx") == "answer"
+
+    assert loader.llm.tokenized.count(PROMPT_PREFIX) == 1
+    assert loader.llm.prompts[0][:2] == [0, len(PROMPT_PREFIX)]
+    assert all(isinstance(t, int) for t in loader.llm.prompts[1])
+
+
+def test_achat_runs_off_the_event_loop(tmp_path):
+    loader = ModelLoader(model_path=str(tmp_path / "missing.gguf"))
+    loader.llm = FakeLlama()
+
+    assert asyncio.run(loader.achat("hi")) == "answer"
+    assert loader.llm.prompts == ["hi"]
+
+
+def test_stream_chat_does_not_hold_the_lock_while_consumed(tmp_path):
+    loader = ModelLoader(model_path=str(tmp_path / "missing.gguf"))
+
+    def fake_stream(prompt, stream=False, **kwargs):
+        for piece in ("a", "b", "c"):
+            yield {"choices": [{"text": piece}]}
+
+    loader.llm = fake_stream
+    stream = loader.stream_chat("hi")
+    assert next(stream) == "a"
+
+    # the consumer is paused mid-stream; generation finishes and frees the lock
+    assert loader._llm_lock.acquire(timeout=2)
+    loader._llm_lock.release()
+    assert list(stream) == ["b", "c"]
@@ -0,0 +1,228 @@
+import numpy as np
+import faiss
+
+from multi_doc_chat.rag_service import RAGService
+
+
+# -------------------------
+# Fake loader (no models, deterministic vectors)
+# -------------------------
+class FakeLoader:
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.embedder = object()
+        self.documents = []
+
+    def embed(self, texts):
+        rng = np.random.default_rng(abs(hash(tuple(texts))) % (2**32))
+        return rng.standard_normal((len(texts), self.dim)).astype("float32")
+
+    def embed_query(self, text):
+        return self.embed([text])
+
+
+def test_small_corpus_uses_sq8(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ingest_documents([f"chunk {i}" for i in range(10)])
+
+    assert isinstance(rag.index, faiss.IndexScalarQuantizer)
+    assert rag.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert rag.index.ntotal == 10
+    assert len(rag.search("chunk 1", top_k=3)) == 3
+
+
+def test_flat_index_factory(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.index_factory = "Flat"
+    rag.ingest_documents([f"chunk {i}" for i in range(10)])
+
+    assert isinstance(rag.index, faiss.IndexFlatIP)
+    assert rag.index.ntotal == 10
+
+
+def test_legacy_flat_l2_index_is_rebuilt_as_ip(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ingest_documents([f"chunk {i}" for i in range(5)])
+    legacy = faiss.IndexFlatL2(rag.index.d)
+    legacy.add(rag.index.reconstruct_n(0, 5))
+    faiss.write_index(legacy, str(tmp_path / "index.bin"))
+
+    reloaded = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+
+    assert reloaded.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert reloaded.index.ntotal == 5
+
+
+def test_duplicate_chunks_are_not_reindexed(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ingest_documents(["same", "other", "same"])
+    assert list(rag.documents) == ["same", "other"]
+
+    reloaded = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    reloaded.ingest_documents(["other", "new"])
+    assert list(reloaded.documents) == ["same", "other", "new"]
+    assert reloaded.index.ntotal == 3
+
+
+def test_index_checkpoint_and_catch_up(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.checkpoint_every = 8
+
+    rag.ingest_documents([f"chunk {i}" for i in range(10)])
+    assert (tmp_path / "index.bin").exists()
+    rag.ingest_documents(["late 1", "late 2"])
+
+    # restart without a checkpoint: the two late docs come back from the journal
+    reloaded = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    assert len(reloaded.documents) == 12
+    assert reloaded.index.ntotal == 12
+
+    reloaded.checkpoint()
+    assert RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path)).index.ntotal == 12
+
+
+def test_repeated_question_skips_generation(tmp_path):
+    loader = FakeLoader()
+    calls = []
+    loader.llm = object()
+    loader.answer_from_rag = lambda q, context="", max_tokens=256: calls.append(q) or f"answer {len(calls)}"
+    rag = RAGService(model_loader=loader, faiss_dir=str(tmp_path))
+    rag.ingest_documents(["some chunk"])
+
+    assert rag.query("what?") == "answer 1"
+    assert rag.query("what?") == "answer 1"
+    assert calls == ["what?"]
+
+    rag.ingest_documents(["another chunk"])  # new corpus invalidates answers
+    assert rag.query("what?") == "answer 2"
+
+
+def test_cached_answer_requires_same_generation_settings(tmp_path):
+    loader = FakeLoader()
+    calls = []
+    loader.llm = object()
+    loader.answer_from_rag = lambda q, context="", max_tokens=256: calls.append(max_tokens) or f"answer {len(calls)}"
+    rag = RAGService(model_loader=loader, faiss_dir=str(tmp_path))
+    rag.ingest_documents(["some chunk"])
+
+    assert rag.query("what?") == "answer 1"
+    assert rag.query("what?", top_k=10) == "answer 2"
+    assert rag.query("what?", top_k=10, max_tokens=1024) == "answer 3"
+    assert rag.query("what?", top_k=10, max_tokens=1024) == "answer 3"
+    assert calls == [256, 256, 1024]
+
+
+def test_large_corpus_switches_to_ivf(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ann_min_vectors = 200
+    rag.ann_factory = "IVF4,Flat"
+
+    rag.ingest_documents([f"chunk {i}" for i in range(250)])
+
+    ivf = faiss.extract_index_ivf(rag.index)
+    assert ivf.nprobe == rag.nprobe
+    assert rag.index.ntotal == 250
+    assert len(rag.search("chunk 1", top_k=3)) == 3
+
+
+def test_ann_nlist_is_sized_from_corpus(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ann_min_vectors = 200
+    rag.ann_factory = "IVF{nlist},Flat"
+
+    rag.ingest_documents([f"chunk {i}" for i in range(256)])
+
+    # 4 * sqrt(256) lists
+    assert faiss.extract_index_ivf(rag.index).nlist == 64
+
+    faiss.extract_index_ivf(rag.index).nprobe = 3
+    rag.checkpoint()
+    reloaded = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    assert faiss.extract_index_ivf(reloaded.index).nprobe == 16
+
+
+def test_journal_replays_vectors_without_re_embedding(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.checkpoint_every = 4
+    rag.ingest_documents([f"chunk {i}" for i in range(4)])  # checkpointed
+    rag.ingest_documents(["late 1", "late 2"])  # journaled only
+    expected = rag.index.reconstruct_n(0, 6)
+
+    loader = FakeLoader()
+    embedded = []
+    embed = loader.embed
+    loader.embed = lambda texts: embedded.extend(texts) or embed(texts)
+    reloaded = RAGService(model_loader=loader, faiss_dir=str(tmp_path))
+
+    assert embedded == []
+    np.testing.assert_allclose(reloaded.index.reconstruct_n(0, 6), expected)
+
+    reloaded.checkpoint()
+    assert not (tmp_path / "index.journal").exists()
+
+
+def test_sq8_trained_on_small_batch_keeps_range_margin(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    first = rag.loader.embed(["a", "b", "c"])
+    rag.ingest_documents(["a", "b", "c"])
+
+    # a component just past the first batch's maximum is not clipped to it
+    probe = first[:1].copy()
+    probe[0, 0] = first.max() + 0.05 * np.ptp(first)
+    rag.index.add(probe)
+    restored = rag.index.reconstruct(3)
+    assert abs(restored[0] - probe[0, 0]) < 0.02 * np.ptp(first)
+
+
+def test_chunks_indexed_during_embedding_are_not_added_twice(tmp_path):
+    loader = FakeLoader()
+    embed = loader.embed
+    rag = RAGService(model_loader=loader, faiss_dir=str(tmp_path))
+
+    def racing_embed(texts):
+        # another upload of "shared" finishes while this batch is embedded
+        loader.embed = embed
+        rag.ingest_documents(["shared"])
+        return embed(texts)
+
+    loader.embed = racing_embed
+    rag.ingest_documents(["shared", "own"])
+
+    assert list(rag.documents) == ["shared", "own"]
+    assert rag.index.ntotal == 2
+
+
+def test_search_cache_keeps_one_entry_per_query(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ingest_documents([f"chunk {i}" for i in range(10)])
+
+    first = rag.search("chunk 1", top_k=2)
+    wider = rag.search("chunk 1", top_k=5)
+
+    class NoSearch:
+        def search(self, *args):
+            raise AssertionError("expected a cache hit")
+
+    rag.index = NoSearch()
+    assert len(wider) == 5
+    assert rag.search("chunk 1", top_k=2) == first
+    assert rag.search("chunk 1", top_k=5) == wider
+    assert len(rag._search_cache) == 1
+
+
+def test_ann_training_does_not_block_ingest(tmp_path):
+    rag = RAGService(model_loader=FakeLoader(), faiss_dir=str(tmp_path))
+    rag.ann_min_vectors = 200
+    rag.ann_factory = "IVF{nlist},Flat"
+    train = rag._train_ann
+
+    def train_while_ingesting(vectors, dim):
+        # the index lock is free during training: this ingest goes through
+        rag.ingest_documents(["late chunk"])
+        return train(vectors, dim)
+
+    rag._train_ann = train_while_ingesting
+    rag.ingest_documents([f"chunk {i}" for i in range(250)])
+
+    assert faiss.extract_index_ivf(rag.index) is not None
+    assert rag.index.ntotal == 251 == len(rag.documents)
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from multi_doc_chat.utils.rwlock import RWLock
+
+
+def test_readers_share_and_writer_excludes():
+    lock = RWLock()
+    inside = []
+    both_readers_in = threading.Barrier(2, timeout=2)
+
+    def reader():
+        with lock.reader():
+            both_readers_in.wait()  # deadlocks (times out) if readers were exclusive
+            inside.append("r")
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert inside == ["r", "r"]
+
+    events = []
+
+    def writer():
+        with lock.writer():
+            events.append("w-start")
+            time.sleep(0.05)
+            events.append("w-end")
+
+    with lock.reader():
+        w = threading.Thread(target=writer)
+        w.start()
+        time.sleep(0.05)
+        assert events == []  # writer waits for the active reader
+    w.join()
+    assert events == ["w-start", "w-end"]
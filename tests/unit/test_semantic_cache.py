@@ -0,0 +1,26 @@
+import numpy as np
+
+from multi_doc_chat.semantic_cache import SemanticCache
+
+
+def test_hit_on_near_duplicate_vector():
+    cache = SemanticCache(capacity=4, threshold=0.97)
+    v = np.array([1.0, 0.0, 0.0], dtype="float32")
+    cache.put(v, "answer")
+
+    assert cache.get(v * 3) == "answer"
+    assert cache.get(np.array([0.0, 1.0, 0.0])) is None
+
+
+def test_fifo_eviction_and_zero_vectors():
+    cache = SemanticCache(capacity=2, threshold=0.99)
+    basis = np.eye(3, dtype="float32")
+    for i in range(3):
+        cache.put(basis[i], i)
+
+    assert len(cache) == 2
+    assert cache.get(basis[0]) is None
+    assert cache.get(basis[2]) == 2
+
+    cache.put(np.zeros(3), "ignored")
+    assert cache.get(np.zeros(3)) is None
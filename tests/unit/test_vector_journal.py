@@ -0,0 +1,25 @@
+import numpy as np
+
+from multi_doc_chat.vector_journal import VectorJournal
+
+
+def test_append_and_read_contiguous_rows(tmp_path):
+    journal = VectorJournal(tmp_path / "index.journal")
+    rows = np.arange(12, dtype="float32").reshape(6, 2)
+    journal.append(10, rows[:4])
+    journal.append(14, rows[4:])
+
+    reloaded = VectorJournal(tmp_path / "index.journal")
+    assert (reloaded.base, reloaded.rows) == (10, 6)
+    np.testing.assert_array_equal(reloaded.read(12, 10), rows[2:])
+    assert reloaded.read(3, 5).shape == (0, 2)
+
+
+def test_non_contiguous_append_restarts(tmp_path):
+    journal = VectorJournal(tmp_path / "index.journal")
+    journal.append(0, np.ones((3, 2), dtype="float32"))
+    journal.append(7, np.zeros((1, 2), dtype="float32"))
+
+    assert (journal.base, journal.rows) == (7, 1)
+    journal.reset()
+    assert not (tmp_path / "index.journal").exists()